@@ -1,19 +1,20 @@
-import os
+from pathlib import Path
+
+# The data directory lives in the project root, one level up from backend
+DATA_DIR = Path(__file__).resolve().parent.parent / "data"
+
+_DATA_DIR_READY = False
 
 def ensure_data_directory():
     """Ensure the data directory exists in the project root."""
-    # Get the current directory (backend)
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    
-    # Navigate to the project root (one level up)
-    project_root = os.path.dirname(current_dir)
-    
-    # Create the data directory if it doesn't exist
-    data_dir = os.path.join(project_root, "data")
-    os.makedirs(data_dir, exist_ok=True)
-    
-    print(f"Data directory ensured at: {data_dir}")
-    return data_dir
+    global _DATA_DIR_READY
+
+    # Only touch the filesystem the first time we are called
+    if not _DATA_DIR_READY:
+        DATA_DIR.mkdir(parents=True, exist_ok=True)
+        _DATA_DIR_READY = True
+
+    return str(DATA_DIR)
 
 if __name__ == "__main__":
-    ensure_data_directory()
\ No newline at end of file
+    print(f"Data directory ensured at: {ensure_data_directory()}")
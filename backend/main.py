@@ -1,20 +1,28 @@
 import os
-import json
+import re
+import logging
+import asyncio
+import time
+import tempfile
+from pathlib import Path
 from typing import List, Optional, Dict, Any, Union
-from datetime import datetime
+from datetime import datetime, timezone
 from fastapi import FastAPI, HTTPException, Header
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, ConfigDict, model_validator
 import httpx
+import orjson
+from cachetools import TTLCache
 import dotenv
 from ensure_data_dir import ensure_data_directory
 
-# Add this class for datetime serialization
-class DateTimeEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, datetime):
-            return obj.isoformat()
-        return super().default(obj)
+# Configure logging
+logging.basicConfig(
+    level=logging.WARNING,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+)
+logger = logging.getLogger(__name__)
 
 # Ensure data directory exists
 data_dir = ensure_data_directory()
@@ -22,7 +30,7 @@ data_dir = ensure_data_directory()
 # Load environment variables
 dotenv.load_dotenv()
 
-app = FastAPI(title="AI Pricing Backend")
+app = FastAPI(title="AI Pricing Backend", default_response_class=ORJSONResponse)
 
 # Configure CORS
 app.add_middleware(
@@ -35,6 +43,9 @@ app.add_middleware(
 
 # Models
 class Product(BaseModel):
+    # Instances are shared between requests through ShopifyClient's cache
+    model_config = ConfigDict(frozen=True)
+
     id: int
     title: str
     description: Optional[str] = None
@@ -47,6 +58,9 @@ class Product(BaseModel):
     image_url: Optional[str] = None
 
 class Discount(BaseModel):
+    # Instances are shared between requests through ShopifyClient's cache
+    model_config = ConfigDict(frozen=True)
+
     id: int
     code: str
     value_type: str  # percentage, fixed_amount, etc.
@@ -121,8 +135,75 @@ class ListDiscountsData(BaseModel):
 class ListCampaignsData(BaseModel):
     campaigns: List[Campaign]
 
+# Shopify API payloads
+class ShopifyProduct(Product):
+    """Product parsed directly from a Shopify Admin API product object."""
+
+    @model_validator(mode="before")
+    @classmethod
+    def from_shopify(cls, data: Any) -> Any:
+        if not isinstance(data, dict):
+            return data
+        # Use the main variant for price and inventory
+        variant = data["variants"][0] if data.get("variants") else {}
+        image = data.get("image") or {}
+        return {
+            **data,
+            "description": data.get("body_html", ""),
+            "price": variant.get("price", "0.00"),
+            "inventory_quantity": variant.get("inventory_quantity", 0),
+            "image_url": image.get("src") or None,
+        }
+
+class ProductsEnvelope(BaseModel):
+    products: List[ShopifyProduct] = []
+
+def _json(response: httpx.Response) -> Any:
+    """Decode a JSON response body with orjson instead of httpx's stdlib-based .json()."""
+    return orjson.loads(response.content)
+
+# Client-side mirror of Shopify's leaky bucket rate limiter
+class AsyncLeakyBucket:
+    def __init__(self, rate: float = 2.0, capacity: int = 40):
+        self.rate = rate  # requests leaked per second
+        self.capacity = capacity
+        self._level = 0.0
+        self._last = time.monotonic()
+        self._lock = asyncio.Lock()
+    
+    def _leak(self):
+        now = time.monotonic()
+        self._level = max(0.0, self._level - (now - self._last) * self.rate)
+        self._last = now
+    
+    async def __aenter__(self):
+        # Waiters queue on the lock so they are released in order
+        async with self._lock:
+            self._leak()
+            if self._level + 1 > self.capacity:
+                await asyncio.sleep((self._level + 1 - self.capacity) / self.rate)
+                self._leak()
+            self._level += 1
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
+    
+    def update(self, call_limit: Optional[str]):
+        """Sync with the server's view from an X-Shopify-Shop-Api-Call-Limit header, e.g. "32/40"."""
+        if not call_limit:
+            return
+        try:
+            used, capacity = (int(part) for part in call_limit.split("/"))
+        except ValueError:
+            return
+        self._leak()
+        self._level = float(used)
+        self.capacity = capacity
+
 # Shopify API client
 class ShopifyClient:
+    MAX_ATTEMPTS = 3
+    
     def __init__(self):
         self.shop_url = os.getenv("SHOPIFY_SHOP_URL")
         self.access_token = os.getenv("SHOPIFY_ACCESS_TOKEN")
@@ -133,96 +214,141 @@ class ShopifyClient:
         
         self.base_url = f"https://{self.shop_url}/admin/api/{self.api_version}"
         self.headers = {"X-Shopify-Access-Token": self.access_token}
+        
+        # Shared client so connections (and TLS sessions) are pooled across requests
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            headers=self.headers,
+            http2=True,
+            limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+        )
+        # Bound concurrent requests so fan-outs stay within Shopify's rate limit
+        self._sem = asyncio.Semaphore(8)
+        # Short-lived cache of parsed responses, keyed by endpoint
+        self._cache = TTLCache(maxsize=3, ttl=30)
+        self._bucket = AsyncLeakyBucket(rate=2.0, capacity=40)
+    
+    async def aclose(self):
+        await self._client.aclose()
+    
+    async def _get(self, url: str) -> httpx.Response:
+        """GET a Shopify endpoint, respecting the rate limit and retrying on 429."""
+        for attempt in range(self.MAX_ATTEMPTS):
+            async with self._bucket:
+                response = await self._client.get(url)
+            self._bucket.update(response.headers.get("X-Shopify-Shop-Api-Call-Limit"))
+            if response.status_code != 429 or attempt == self.MAX_ATTEMPTS - 1:
+                return response
+            # Back off exponentially from the server's suggested delay
+            retry_after = float(response.headers.get("Retry-After", "1"))
+            await asyncio.sleep(retry_after * 2 ** attempt)
     
     async def get_products(self) -> List[Product]:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(f"{self.base_url}/products.json", headers=self.headers)
-            response.raise_for_status()
-            data = response.json()
-            
-            products = []
-            for product_data in data.get("products", []):
-                # Extract the main variant price
-                price = "0.00"
-                inventory_quantity = 0
-                if product_data.get("variants") and len(product_data["variants"]) > 0:
-                    price = product_data["variants"][0].get("price", "0.00")
-                    inventory_quantity = product_data["variants"][0].get("inventory_quantity", 0)
-                
-                # Extract image URL if available
-                image_url = None
-                if product_data.get("image") and product_data["image"].get("src"):
-                    image_url = product_data["image"]["src"]
-                
-                products.append(Product(
-                    id=product_data["id"],
-                    title=product_data["title"],
-                    description=product_data.get("body_html", ""),
-                    price=price,
-                    vendor=product_data.get("vendor"),
-                    product_type=product_data.get("product_type"),
-                    handle=product_data.get("handle"),
-                    status=product_data.get("status"),
-                    inventory_quantity=inventory_quantity,
-                    image_url=image_url
-                ))
-            
-            return products
+        cached = self._cache.get("products")
+        if cached is not None:
+            return cached
+        
+        response = await self._get("/products.json")
+        response.raise_for_status()
+        # Validate the raw bytes straight into models, skipping response.json()
+        products = ProductsEnvelope.model_validate_json(response.content).products
+        
+        self._cache["products"] = products
+        # Drop any index built from the previous product list
+        self._cache.pop("products_by_id", None)
+        return products
+    
+    async def get_products_by_id(self) -> Dict[int, Product]:
+        cached = self._cache.get("products_by_id")
+        if cached is not None:
+            return cached
+        
+        products_by_id = {p.id: p for p in await self.get_products()}
+        self._cache["products_by_id"] = products_by_id
+        return products_by_id
     
     async def get_discounts(self) -> List[Discount]:
+        cached = self._cache.get("discounts")
+        if cached is not None:
+            return cached
+        
         # First get price rules
-        async with httpx.AsyncClient() as client:
-            response = await client.get(f"{self.base_url}/price_rules.json", headers=self.headers)
-            response.raise_for_status()
-            price_rules_data = response.json()
-            
-            discounts = []
-            for rule in price_rules_data.get("price_rules", []):
-                # Get discount codes for this price rule
-                discount_response = await client.get(
-                    f"{self.base_url}/price_rules/{rule['id']}/discount_codes.json", 
-                    headers=self.headers
-                )
-                discount_response.raise_for_status()
-                discount_codes = discount_response.json().get("discount_codes", [])
-                
-                for code in discount_codes:
-                    discounts.append(Discount(
-                        id=code["id"],
-                        code=code["code"],
-                        value_type=rule["value_type"],
-                        value=rule["value"],
-                        title=rule.get("title"),
-                        starts_at=rule.get("starts_at"),
-                        ends_at=rule.get("ends_at"),
-                        usage_count=code.get("usage_count"),
-                        target_type=rule.get("target_type")
-                    ))
+        response = await self._get("/price_rules.json")
+        response.raise_for_status()
+        rules = _json(response).get("price_rules", [])
+        
+        # Get discount codes for all price rules concurrently
+        async def get_discount_codes(rule):
+            async with self._sem:
+                return await self._get(f"/price_rules/{rule['id']}/discount_codes.json")
+        
+        responses = await asyncio.gather(*(get_discount_codes(rule) for rule in rules))
+        
+        discounts = []
+        for rule, discount_response in zip(rules, responses):
+            discount_response.raise_for_status()
+            discount_codes = _json(discount_response).get("discount_codes", [])
             
-            return discounts
+            for code in discount_codes:
+                discounts.append(Discount(
+                    id=code["id"],
+                    code=code["code"],
+                    value_type=rule["value_type"],
+                    value=rule["value"],
+                    title=rule.get("title"),
+                    starts_at=rule.get("starts_at"),
+                    ends_at=rule.get("ends_at"),
+                    usage_count=code.get("usage_count"),
+                    target_type=rule.get("target_type")
+                ))
+        
+        self._cache["discounts"] = discounts
+        return discounts
 
 # Campaign storage
 class CampaignStorage:
     def __init__(self, file_path="../data/campaign.json"):
-        self.file_path = file_path
+        # Resolve once so later opens don't re-walk the path
+        self.file_path = Path(file_path).resolve()
         self._ensure_file_exists()
     
     def _ensure_file_exists(self):
-        # Ensure the directory exists
-        os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
-        if not os.path.exists(self.file_path):
-            with open(self.file_path, "w") as f:
-                json.dump({"campaign": {}}, f)
+        if not self.file_path.exists():
+            # Ensure the directory exists
+            self.file_path.parent.mkdir(parents=True, exist_ok=True)
+            self._write(orjson.dumps({"campaign": {}}))
+    
+    def _write(self, payload: bytes):
+        # Write to a temp file in the same directory, then atomically swap it in
+        fd, tmp_path = tempfile.mkstemp(dir=self.file_path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                # mkstemp creates the file as 0600; keep the current file's mode so
+                # other readers (e.g. the MCP server) can still open it after the swap
+                try:
+                    mode = self.file_path.stat().st_mode & 0o777
+                except FileNotFoundError:
+                    mode = 0o644
+                os.chmod(tmp_path, mode)
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.file_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    
+    def _read(self) -> bytes:
+        with open(self.file_path, "rb") as f:
+            return f.read()
     
     def load_campaign(self) -> Dict[str, Any]:
-        with open(self.file_path, "r") as f:
-            data = json.load(f)
-            return data.get("campaign", {})
+        data = orjson.loads(self._read())
+        return data.get("campaign", {})
     
     def save_campaign(self, campaign: Dict[str, Any]):
-        with open(self.file_path, "w") as f:
-            # Use the custom encoder for datetime objects
-            json.dump({"campaign": campaign}, f, cls=DateTimeEncoder)
+        # orjson serializes datetime objects natively
+        self._write(orjson.dumps({"campaign": campaign}))
     
     def get_campaign(self) -> Optional[Dict[str, Any]]:
         campaign = self.load_campaign()
@@ -230,22 +356,25 @@ class CampaignStorage:
             return None
         return campaign
     
-    def add_campaign(self, campaign: Dict[str, Any]):
+    def add_campaign(self, campaign: Dict[str, Any], now: Optional[datetime] = None) -> Dict[str, Any]:
         # Set a fixed ID
         campaign["id"] = "current_campaign"
         # Add timestamps
-        now = datetime.now().isoformat()
+        now = now or datetime.now(timezone.utc)
         campaign["created_at"] = now
         campaign["updated_at"] = now
         # Save the campaign (overwriting any existing one)
         self.save_campaign(campaign)
         return campaign
     
-    def update_campaign(self, campaign_id: str, updated_campaign: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    def update_campaign(self, campaign_id: str, updated_campaign: Dict[str, Any], now: Optional[datetime] = None) -> Optional[Dict[str, Any]]:
         # Ignore campaign_id since we only have one campaign
+        now = now or datetime.now(timezone.utc)
+        # Only created_at is needed, so skip validating the stored campaign
+        created_at = self.load_campaign().get("created_at")
         updated_campaign["id"] = "current_campaign"
-        updated_campaign["created_at"] = self.load_campaign().get("created_at", datetime.now().isoformat())
-        updated_campaign["updated_at"] = datetime.now().isoformat()
+        updated_campaign["created_at"] = created_at or now
+        updated_campaign["updated_at"] = now
         self.save_campaign(updated_campaign)
         return updated_campaign
     
@@ -256,7 +385,11 @@ class CampaignStorage:
 
 # Initialize clients
 shopify_client = ShopifyClient()
-campaign_storage = CampaignStorage(os.path.join(data_dir, "campaign.json"))
+campaign_storage = CampaignStorage(Path(data_dir) / "campaign.json")
+
+@app.on_event("shutdown")
+async def close_shopify_client():
+    await shopify_client.aclose()
 
 # API Routes
 @app.get("/_healthz", response_model=Dict[str, str])
@@ -267,61 +400,61 @@ async def check_health():
 async def list_products():
     try:
         products = await shopify_client.get_products()
-        print(f"Returning {len(products)} products") # Debug log
-        return {"products": products}
+        logger.debug("Returning %d products", len(products))
+        return ORJSONResponse(content={"products": [p.model_dump(mode="json", exclude_none=True) for p in products]})
     except Exception as e:
-        print(f"Error fetching products: {str(e)}") # Debug log
+        logger.exception("Error fetching products")
         raise HTTPException(status_code=500, detail=f"Failed to fetch products: {str(e)}")
 
 @app.get("/routes/api/discounts", response_model=ListDiscountsData)
 async def list_discounts():
     try:
         discounts = await shopify_client.get_discounts()
-        print(f"Returning {len(discounts)} discounts") # Debug log
-        return {"discounts": discounts}
+        logger.debug("Returning %d discounts", len(discounts))
+        return ORJSONResponse(content={"discounts": [d.model_dump(mode="json", exclude_none=True) for d in discounts]})
     except Exception as e:
-        print(f"Error fetching discounts: {str(e)}") # Debug log
+        logger.exception("Error fetching discounts")
         raise HTTPException(status_code=500, detail=f"Failed to fetch discounts: {str(e)}")
 
 @app.get("/routes/api/campaigns", response_model=ListCampaignsData)
 async def list_campaigns():
     campaign = campaign_storage.get_campaign()
     campaigns = [campaign] if campaign else []
-    return {"campaigns": campaigns}
+    return ORJSONResponse(content={"campaigns": campaigns})
 
 @app.get("/routes/api/campaigns/{campaign_id}", response_model=Campaign)
 async def get_campaign(campaign_id: str):
     campaign = campaign_storage.get_campaign()
     if not campaign:
         raise HTTPException(status_code=404, detail="Campaign not found")
-    return campaign
+    return ORJSONResponse(content=campaign)
 
 @app.post("/routes/api/campaigns", response_model=Campaign)
 async def create_campaign(campaign: Campaign):
     try:
-        print(f"Received campaign creation request: {campaign}")
+        logger.debug("Received campaign creation request: %s", campaign)
         
         # Enrich the campaign with detailed product and discount information
-        enriched_campaign = await enrich_campaign_data(campaign)
+        now = datetime.now(timezone.utc)
+        enriched_campaign = await enrich_campaign_data(campaign, now)
         
-        created_campaign = campaign_storage.add_campaign(enriched_campaign.model_dump())
-        print(f"Campaign created successfully: {created_campaign}")
-        return created_campaign
+        created_campaign = campaign_storage.add_campaign(enriched_campaign, now)
+        logger.debug("Campaign created successfully: %s", created_campaign)
+        return ORJSONResponse(content=created_campaign)
     except Exception as e:
-        print(f"Error creating campaign: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error creating campaign")
         raise HTTPException(status_code=500, detail=f"Failed to create campaign: {str(e)}")
 
 @app.put("/routes/api/campaigns/{campaign_id}", response_model=Campaign)
 async def update_campaign(campaign_id: str, campaign: Campaign):
     # Enrich the campaign with detailed product and discount information
-    enriched_campaign = await enrich_campaign_data(campaign)
+    now = datetime.now(timezone.utc)
+    enriched_campaign = await enrich_campaign_data(campaign, now)
     
-    updated_campaign = campaign_storage.update_campaign(campaign_id, enriched_campaign.model_dump())
+    updated_campaign = campaign_storage.update_campaign(campaign_id, enriched_campaign, now)
     if not updated_campaign:
         raise HTTPException(status_code=404, detail="Campaign not found")
-    return updated_campaign
+    return ORJSONResponse(content=updated_campaign)
 
 @app.delete("/routes/api/campaigns/{campaign_id}", response_model=Dict[str, bool])
 async def delete_campaign(campaign_id: str):
@@ -334,57 +467,61 @@ async def delete_campaign(campaign_id: str):
 async def test_endpoint():
     return {"status": "ok", "message": "API connection working"}
 
-async def enrich_campaign_data(campaign: Campaign) -> Campaign:
+async def enrich_campaign_data(campaign: Campaign, now: Optional[datetime] = None) -> Dict[str, Any]:
     """Enrich campaign data with detailed product and discount information."""
+    now_iso = (now or datetime.now(timezone.utc)).isoformat()
     campaign_dict = campaign.model_dump()
     
+    # Fetch products and discounts once, concurrently, for the whole campaign
+    product_map, all_discounts = await asyncio.gather(
+        shopify_client.get_products_by_id() if campaign.product_ids else asyncio.sleep(0, result={}),
+        shopify_client.get_discounts() if campaign.discount_ids else asyncio.sleep(0, result=[]),
+        return_exceptions=True,
+    )
+    discount_ids = frozenset(campaign.discount_ids)
+    
+    # Select the campaign's discounts once; both sections below work from this list
+    selected_discounts = []
+    if not isinstance(all_discounts, Exception):
+        selected_discounts = [d for d in all_discounts if d.id in discount_ids]
+    
     # Add detailed product information
     if campaign.product_ids:
         products = []
         try:
-            all_products = await shopify_client.get_products()
-            product_map = {str(p.id): p for p in all_products}
+            if isinstance(product_map, Exception):
+                raise product_map
+            if isinstance(all_discounts, Exception):
+                raise all_discounts
+            # Parse discount values once, up front.
+            # Values may be stored negative (e.g. "-30.0") or positive; normalise to negative.
+            prepared_discounts = [
+                (d.value_type, -abs(float(d.value)), abs(float(d.value)))
+                for d in selected_discounts
+            ]
             
             for product_id in campaign.product_ids:
-                product_id_str = str(product_id)
-                if product_id_str in product_map:
-                    product = product_map[product_id_str]
+                product = product_map.get(product_id)
+                if product is not None:
                     # Calculate discounted price if there are discounts
                     original_price = float(product.price)
                     discounted_price = original_price
                     discount_percentage = 0.0
                     
                     # Apply discounts if available
-                    if campaign.discount_ids:
-                        discounts = await shopify_client.get_discounts()
-                        for discount in discounts:
-                            if discount.id in campaign.discount_ids:
-                                if discount.value_type == "percentage":
-                                    # Fix: The value is negative (e.g., "-30.0"), so we need to handle it correctly
-                                    discount_value = float(discount.value)
-                                    # If the value is negative, it's already in the right format
-                                    # If it's positive, we need to negate it for the calculation
-                                    if discount_value > 0:
-                                        discount_value = -discount_value
-                                    
-                                    # Calculate the discount percentage (as a positive number for display)
-                                    discount_percentage = abs(discount_value)
-                                    
-                                    # Apply the discount to the price
-                                    discounted_price = original_price * (1 + (discount_value / 100))
-                                elif discount.value_type == "fixed_amount":
-                                    # Fix: The value might be negative (e.g., "-10.0")
-                                    discount_value = float(discount.value)
-                                    # If the value is negative, it's already in the right format
-                                    # If it's positive, we need to negate it for the calculation
-                                    if discount_value > 0:
-                                        discount_value = -discount_value
-                                    
-                                    # Apply the discount to the price
-                                    discounted_price = max(0, original_price + discount_value)
-                                    
-                                    # Calculate the discount percentage
-                                    discount_percentage = abs((discount_value / original_price) * 100) if original_price > 0 else 0
+                    for value_type, discount_value, abs_value in prepared_discounts:
+                        if value_type == "percentage":
+                            # Calculate the discount percentage (as a positive number for display)
+                            discount_percentage = abs_value
+                            
+                            # Apply the discount to the price
+                            discounted_price = original_price * (1 + (discount_value / 100))
+                        elif value_type == "fixed_amount":
+                            # Apply the discount to the price
+                            discounted_price = max(0, original_price + discount_value)
+                            
+                            # Calculate the discount percentage
+                            discount_percentage = (abs_value / original_price) * 100 if original_price > 0 else 0
                     
                     products.append({
                         "id": product.id,
@@ -402,32 +539,31 @@ async def enrich_campaign_data(campaign: Campaign) -> Campaign:
                     })
             
             campaign_dict["detailed_products"] = products
-        except Exception as e:
-            print(f"Error enriching product data: {str(e)}")
+        except Exception:
+            logger.exception("Error enriching product data")
             campaign_dict["detailed_products"] = []
     
     # Add detailed discount information
     if campaign.discount_ids:
-        detailed_discounts = []
         try:
-            all_discounts = await shopify_client.get_discounts()
-            for discount in all_discounts:
-                if discount.id in campaign.discount_ids:
-                    detailed_discounts.append({
-                        "id": discount.id,
-                        "code": discount.code,
-                        "value_type": discount.value_type,
-                        "value": discount.value,
-                        "title": discount.title,
-                        "starts_at": discount.starts_at.isoformat() if discount.starts_at else None,
-                        "ends_at": discount.ends_at.isoformat() if discount.ends_at else None,
-                        "usage_count": discount.usage_count,
-                        "target_type": discount.target_type
-                    })
-            
-            campaign_dict["detailed_discounts"] = detailed_discounts
-        except Exception as e:
-            print(f"Error enriching discount data: {str(e)}")
+            if isinstance(all_discounts, Exception):
+                raise all_discounts
+            campaign_dict["detailed_discounts"] = [
+                {
+                    "id": discount.id,
+                    "code": discount.code,
+                    "value_type": discount.value_type,
+                    "value": discount.value,
+                    "title": discount.title,
+                    "starts_at": discount.starts_at.isoformat() if discount.starts_at else None,
+                    "ends_at": discount.ends_at.isoformat() if discount.ends_at else None,
+                    "usage_count": discount.usage_count,
+                    "target_type": discount.target_type
+                }
+                for discount in selected_discounts
+            ]
+        except Exception:
+            logger.exception("Error enriching discount data")
             campaign_dict["detailed_discounts"] = []
     
     # Add campaign metadata for AI agents
@@ -436,11 +572,15 @@ async def enrich_campaign_data(campaign: Campaign) -> Campaign:
         "target_audience": "ai_agents",
         "detection_method": "header_analysis",
         "eligible_agents": extract_agent_names_from_rules(campaign.header_target_rules) if campaign.header_target_rules else [],
-        "created_at": datetime.now().isoformat(),
-        "last_updated": datetime.now().isoformat()
+        "created_at": now_iso,
+        "last_updated": now_iso
     }
     
-    return Campaign(**campaign_dict)
+    return campaign_dict
+
+# Matches parenthesised groups in a regex pattern, e.g. "(ChatGPT|Claude|Bard)"
+_AGENT_GROUP_RE = re.compile(r'\((.*?)\)')
+_UA = "user-agent"
 
 def extract_agent_names_from_rules(rules: List[HeaderTargetRule]) -> List[str]:
     """Extract AI agent names from header target rules."""
@@ -450,12 +590,11 @@ def extract_agent_names_from_rules(rules: List[HeaderTargetRule]) -> List[str]:
         return agent_names
     
     for rule in rules:
-        if rule.header_name.lower() == "user-agent" and rule.condition == "matches":
+        if rule.condition == "matches" and rule.header_name.lower() == _UA:
             # Try to extract agent names from regex patterns
             pattern = rule.value or ""
             # Look for common patterns like (ChatGPT|Claude|Bard)
-            import re
-            matches = re.findall(r'\((.*?)\)', pattern)
+            matches = _AGENT_GROUP_RE.findall(pattern)
             for match in matches:
                 agents = match.split('|')
                 agent_names.extend([a.strip() for a in agents if a.strip()])
@@ -472,6 +611,15 @@ if __name__ == "__main__":
         try:
             port = int(sys.argv[1])
         except ValueError:
-            print(f"Invalid port: {sys.argv[1]}. Using default port 8001.")
+            logger.warning("Invalid port: %s. Using default port %d.", sys.argv[1], port)
     
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    # A single process: the Shopify rate limiter, cache and semaphore are per process,
+    # and several workers would each burst against the same per-app limit.
+    # uvicorn[standard] lets the default "auto" loop and http pick uvloop and httptools
+    uvicorn.run(
+        app,
+        host="0.0.0.0",
+        port=port,
+        log_level="warning",
+        access_log=False,
+    )
@@ -1,10 +1,17 @@
 import contextlib
+import contextvars
 import json
 import logging
 import os
+import secrets
+import threading
+import time
+import weakref
+from collections import OrderedDict, deque
+from collections.abc import Mapping
+from itertools import islice
 from http import HTTPStatus
-from uuid import uuid4
-from datetime import datetime
+from datetime import datetime, timezone
 import re
 
 import anyio
@@ -13,6 +20,8 @@ import mcp.types as types
 from mcp.server.lowlevel import Server
 from mcp.server.streamable_http import (
     MCP_SESSION_ID_HEADER,
+    EventMessage,
+    EventStore,
     StreamableHTTPServerTransport,
 )
 from pydantic import AnyUrl
@@ -21,6 +30,30 @@ from starlette.requests import Request
 from starlette.responses import Response
 from starlette.routing import Mount
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Prefer orjson when it is installed, falling back to the stdlib
+if orjson:
+    json_loads = orjson.loads
+
+    def json_dumps(obj) -> str:
+        return orjson.dumps(obj).decode()
+else:
+    json_loads = json.loads
+    json_dumps = json.dumps
+
+# Fixed tool responses, encoded once. Handlers return a new list each time, but the
+# TextContent inside is shared and must be treated as read-only.
+_NO_PRICING_RESPONSE = [types.TextContent(
+    type="text",
+    text=json_dumps({"message": "We don't have any special pricing available for you at this time."}),
+)]
+_PRODUCT_NOT_FOUND_RESPONSE = [types.TextContent(type="text", text=json_dumps({"error": "Product not found"}))]
+_NO_DISCOUNT_RESPONSE = [types.TextContent(type="text", text=json_dumps({"error": "No discount available"}))]
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -31,28 +64,199 @@ logger = logging.getLogger(__name__)
 # Global task group that will be initialized in the lifespan
 task_group = None
 
-# Simple in-memory event store for resumability
-class InMemoryEventStore:
+# Headers of the HTTP request being handled. Session tasks copy the context when
+# they are started, so each session sees its own headers rather than a shared global.
+# Values are starlette Headers, whose .get() and "in" are already case-insensitive.
+request_headers_var: contextvars.ContextVar[Mapping[str, str]] = contextvars.ContextVar("request_headers", default={})
+
+def _headers_from_request(ctx) -> Mapping[str, str]:
+    # Newer MCP SDKs attach the HTTP request that carried the message
+    if ctx.request is None:
+        return request_headers_var.get()
+    return ctx.request.headers
+
+def _headers_from_context_var(ctx) -> Mapping[str, str]:
+    return request_headers_var.get()
+
+def _detect_headers_getter(ctx):
+    """Pick how to read request headers for the installed MCP SDK."""
+    if hasattr(ctx, "request"):
+        return _headers_from_request
+    return _headers_from_context_var
+
+# Chosen on the first tool call, then reused
+_headers_getter = None
+
+def get_request_headers(ctx) -> Mapping[str, str]:
+    """Return the headers of the request that invoked the current tool."""
+    global _headers_getter
+    if _headers_getter is None:
+        _headers_getter = _detect_headers_getter(ctx)
+    return _headers_getter(ctx)
+
+class _EventStream:
+    """Events of one SSE stream, oldest first, with their per-stream sequence numbers."""
+    __slots__ = ("first_seq", "next_seq", "events")
+
     def __init__(self):
-        self.events = {}
+        self.first_seq = 0
+        self.next_seq = 0
+        # event_id -> message in arrival order
+        self.events = OrderedDict()
+
+# In-memory event store for resumability, keeping the newest max_events across all streams
+class InMemoryEventStore(EventStore):
+    def __init__(self, max_events: int = 10_000):
+        self.max_events = max_events
+        # stream_id -> _EventStream
+        self.streams = {}
+        # event_id -> (stream_id, sequence number in that stream), for O(1) resume lookups
+        self.index = {}
+        # event ids across all streams in arrival order, so the oldest can be dropped
+        self.order = deque()
         
-    async def store_event(self, event_id, event_data):
-        self.events[event_id] = event_data
+    async def store_event(self, stream_id, message):
+        """Store a message sent on a stream and return its new event id."""
+        event_id = secrets.token_hex(16)
+        stream = self.streams.get(stream_id)
+        if stream is None:
+            stream = self.streams[stream_id] = _EventStream()
         
-    async def get_events_after(self, last_event_id):
-        if not last_event_id or last_event_id not in self.events:
-            return []
+        stream.events[event_id] = message
+        self.index[event_id] = (stream_id, stream.next_seq)
+        stream.next_seq += 1
+        self.order.append(event_id)
         
-        event_ids = sorted(self.events.keys())
-        try:
-            idx = event_ids.index(last_event_id)
-            return [self.events[eid] for eid in event_ids[idx+1:]]
-        except ValueError:
-            return []
+        # Drop the oldest event once over capacity; it is also the oldest in its stream
+        if len(self.order) > self.max_events:
+            oldest_stream_id, _ = self.index.pop(self.order.popleft())
+            oldest_stream = self.streams[oldest_stream_id]
+            oldest_stream.events.popitem(last=False)
+            oldest_stream.first_seq += 1
+            if not oldest_stream.events:
+                del self.streams[oldest_stream_id]
+        
+        return event_id
+        
+    async def replay_events_after(self, last_event_id, send_callback):
+        """Send the events that followed last_event_id on its stream and return the stream id."""
+        entry = self.index.get(last_event_id)
+        if entry is None:
+            logger.warning("Event ID %s not found in store", last_event_id)
+            return None
+        
+        stream_id, seq = entry
+        stream = self.streams[stream_id]
+        # Copy first: new events may be stored while we await the callback
+        missed = list(islice(stream.events.items(), seq - stream.first_seq + 1, None))
+        for event_id, message in missed:
+            # Priming events carry no message
+            if message is not None:
+                await send_callback(EventMessage(message, event_id))
+        return stream_id
 
 # Create event store instance
 event_store = InMemoryEventStore()
 
+# Session limits: idle sessions are swept after SESSION_TTL_SECONDS, and the
+# least recently used sessions are evicted beyond MAX_SESSIONS
+SESSION_TTL_SECONDS = 30 * 60
+SESSION_SWEEP_INTERVAL_SECONDS = 60
+MAX_SESSIONS = 10_000
+
+# Bounded registry of live session transports
+class SessionRegistry:
+    def __init__(self, max_sessions: int = MAX_SESSIONS, ttl_seconds: float = SESSION_TTL_SECONDS):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        # session id -> (transport, last used), least recently used first
+        self.sessions = OrderedDict()
+        # session id -> number of HTTP requests (including open streams) in flight
+        self.active = {}
+    
+    def get(self, session_id):
+        """Return the transport for a session and mark it as recently used."""
+        entry = self.sessions.get(session_id)
+        if entry is None:
+            return None
+        self.sessions[session_id] = (entry[0], time.monotonic())
+        self.sessions.move_to_end(session_id)
+        return entry[0]
+    
+    def add(self, session_id, transport) -> list:
+        """Register a transport, returning any transports evicted to stay within the cap."""
+        self.sessions[session_id] = (transport, time.monotonic())
+        self.sessions.move_to_end(session_id)
+        evicted = []
+        excess = len(self.sessions) - self.max_sessions
+        if excess > 0:
+            # Least recently used first, leaving busy sessions and the new one alone
+            idle_ids = (
+                sid for sid in islice(self.sessions, len(self.sessions) - 1)
+                if sid not in self.active
+            )
+            for old_id in list(islice(idle_ids, excess)):
+                old_transport, _ = self.sessions.pop(old_id)
+                evicted.append(old_transport)
+        return evicted
+    
+    @contextlib.contextmanager
+    def in_use(self, session_id):
+        """Mark a session busy while a request, such as a GET stream, is being served."""
+        self.active[session_id] = self.active.get(session_id, 0) + 1
+        try:
+            yield
+        finally:
+            remaining = self.active.pop(session_id) - 1
+            if remaining:
+                self.active[session_id] = remaining
+            entry = self.sessions.get(session_id)
+            if entry is not None:
+                # Idle time counts from when the last request finished
+                self.sessions[session_id] = (entry[0], time.monotonic())
+                self.sessions.move_to_end(session_id)
+    
+    def expire(self) -> list:
+        """Remove and return transports idle for longer than the TTL."""
+        now = time.monotonic()
+        cutoff = now - self.ttl_seconds
+        expired = []
+        while self.sessions:
+            session_id, (transport, last_used) = next(iter(self.sessions.items()))
+            if last_used >= cutoff:
+                break
+            if session_id in self.active:
+                # Still serving a request, e.g. a long-lived SSE stream
+                self.sessions[session_id] = (transport, now)
+                self.sessions.move_to_end(session_id)
+                continue
+            del self.sessions[session_id]
+            expired.append(transport)
+        return expired
+
+# Create session registry instance
+session_registry = SessionRegistry()
+
+async def close_transport(transport):
+    """Terminate a session transport, which also ends its server task."""
+    try:
+        await transport.terminate()
+    except Exception as e:
+        logger.warning("Error closing session %s: %s", transport.mcp_session_id, e)
+
+async def sweep_idle_sessions():
+    """Periodically close sessions that have been idle for longer than the TTL."""
+    while True:
+        await anyio.sleep(SESSION_SWEEP_INTERVAL_SECONDS)
+        expired = session_registry.expire()
+        if expired:
+            logger.info("Closing %d idle sessions", len(expired))
+        for transport in expired:
+            await close_transport(transport)
+
+# MCP logging levels, most verbose first
+LOG_LEVELS = ["debug", "info", "notice", "warning", "error", "critical", "alert", "emergency"]
+
 @contextlib.asynccontextmanager
 async def lifespan(app):
     """Application lifespan context manager for managing task group."""
@@ -60,6 +264,7 @@ async def lifespan(app):
 
     async with anyio.create_task_group() as tg:
         task_group = tg
+        tg.start_soon(sweep_idle_sessions)
         logger.info("Application started, task group initialized!")
         try:
             yield
@@ -70,127 +275,251 @@ async def lifespan(app):
                 task_group = None
             logger.info("Resources cleaned up successfully.")
 
+# Parsed campaign, reused until campaign.json's stat signature changes
+_campaign_cache = {"key": None, "data": None}
+_campaign_cache_lock = threading.Lock()
+
 def load_campaign_data(data_dir: str = "../data") -> dict:
-    """Load campaign data from JSON file."""
+    """Load campaign data from JSON file, re-parsing only when the file changes."""
     try:
         campaign_path = os.path.join(data_dir, "campaign.json")
-        if not os.path.exists(campaign_path):
+        try:
+            st = os.stat(campaign_path)
+        except FileNotFoundError:
             logger.warning(f"Campaign file not found at {campaign_path}")
             return None
         
-        with open(campaign_path, "r") as f:
-            data = json.load(f)
-            return data.get("campaign")
+        key = (campaign_path, st.st_mtime_ns, st.st_size)
+        with _campaign_cache_lock:
+            if _campaign_cache["key"] != key:
+                with open(campaign_path, "rb") as f:
+                    data = json_loads(f.read())
+                campaign = data.get("campaign")
+                if campaign:
+                    prepare_campaign(campaign)
+                _campaign_cache["data"] = campaign
+                _campaign_cache["key"] = key
+            return _campaign_cache["data"]
     except Exception as e:
         logger.error(f"Error loading campaign data: {str(e)}")
         return None
 
+def prepare_campaign(campaign: dict) -> dict:
+    """Precompute per-campaign lookups once per file change rather than per request."""
+    # Compiled targeting rules, or None when the campaign targets all traffic
+    campaign["_rules"] = compile_header_rules(campaign) or None
+    campaign["_start_dt"] = parse_campaign_datetime(campaign.get("start_date"), "start")
+    campaign["_end_dt"] = parse_campaign_datetime(campaign.get("end_date"), "end")
+    # Index products by id so get-discount is a dict lookup rather than a scan
+    products = campaign.get("detailed_products") or []
+    campaign["_products_by_id"] = {str(p.get("id")): p for p in products}
+    # get-discount always offers the first discount code
+    discounts = campaign.get("detailed_discounts") or []
+    campaign["_discount"] = discounts[0] if discounts else None
+    # Serialized get-products payload, filled in on first use
+    campaign["_products_json"] = None
+    return campaign
+
+def parse_campaign_datetime(value, label: str = "") -> datetime:
+    """Parse an ISO date string into an aware UTC datetime; naive values are taken as UTC."""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except (ValueError, TypeError, AttributeError) as e:
+        logger.warning("Invalid %s date format: %s", label, e)
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
 def is_campaign_active(campaign: dict) -> bool:
     """Check if campaign is active based on status and dates."""
     if not campaign or campaign.get("status") != "active":
         return False
     
-    now = datetime.now()
+    if "_start_dt" not in campaign:
+        prepare_campaign(campaign)
+    
+    now = datetime.now(timezone.utc)
     
     # Check start date if it exists
-    start_date_str = campaign.get("start_date")
-    if start_date_str:
-        try:
-            start_date = datetime.fromisoformat(start_date_str.replace("Z", "+00:00"))
-            if now < start_date:
-                logger.info(f"Campaign not started yet. Current: {now}, Start: {start_date}")
-                return False
-        except (ValueError, TypeError) as e:
-            logger.warning(f"Invalid start date format: {e}")
+    start_date = campaign["_start_dt"]
+    if start_date and now < start_date:
+        logger.debug("Campaign not started yet. Current: %s, Start: %s", now, start_date)
+        return False
     
     # Check end date if it exists
-    end_date_str = campaign.get("end_date")
-    if end_date_str:
-        try:
-            end_date = datetime.fromisoformat(end_date_str.replace("Z", "+00:00"))
-            if now > end_date:
-                logger.info(f"Campaign already ended. Current: {now}, End: {end_date}")
-                return False
-        except (ValueError, TypeError) as e:
-            logger.warning(f"Invalid end date format: {e}")
+    end_date = campaign["_end_dt"]
+    if end_date and now > end_date:
+        logger.debug("Campaign already ended. Current: %s, End: %s", now, end_date)
+        return False
     
     return True
 
-def check_header_rule(rule: dict, headers: dict) -> bool:
-    """Check if a header rule matches the provided headers."""
-    # Extract rule components, using lowercase for case-insensitive comparison
-    header_name = rule.get("header_name", "").lower()
-    condition = rule.get("condition", "")
-    value = rule.get("value", "")
-    negate = rule.get("negate", False)
-    
-    # Log the full headers for debugging
-    logger.info(f"All headers received: {headers}")
-    logger.info(f"Checking header rule: {rule}")
-    
-    # Convert all header keys to lowercase for case-insensitive matching
-    lowercase_headers = {k.lower(): v for k, v in headers.items()}
-    
-    # Get the header value using case-insensitive matching
-    header_value = lowercase_headers.get(header_name)
-    
-    logger.info(f"Header '{header_name}' value: {header_value}")
+class CompiledRule:
+    """A header targeting rule with its condition resolved to a match function up front."""
+
+    def __init__(self, rule: dict):
+        self.rule = rule
+        # Use lowercase for case-insensitive header name comparison
+        self.header_name = rule.get("header_name", "").lower()
+        self.condition = rule.get("condition", "")
+        self.negate = rule.get("negate", False)
+        # Compiled pattern for "matches" rules, kept so they can be fused per header
+        self.regex = None
+        self.match = self._build_matcher(self.condition, rule.get("value"))
+
+    def _build_matcher(self, condition: str, value: str | None):
+        """Return a predicate over the header value, or None if the rule can never match."""
+        if condition in ("exists", "notExists"):
+            return None
+        if value is None:
+            # Fail closed rather than letting an empty value match every header
+            logger.warning("Header rule with condition %r has no value", condition)
+            return None
+        if condition == "equals":
+            return lambda header_value: header_value == value
+        if condition == "contains":
+            return lambda header_value: value in header_value
+        if condition == "startsWith":
+            return lambda header_value: header_value.startswith(value)
+        if condition == "endsWith":
+            return lambda header_value: header_value.endswith(value)
+        if condition == "matches":
+            try:
+                self.regex = re.compile(value)
+                return self.regex.search
+            except re.error:
+                logger.warning("Invalid regex pattern: %s", value)
+                return None
+        logger.warning("Unknown condition: %s", condition)
+        return None
+
+    def matches(self, headers: Mapping[str, str]) -> bool:
+        """Check if this rule matches a headers mapping with case-insensitive lookup."""
+        logger.debug("Checking header rule: %s", self.rule)
+        
+        # Get the header value using case-insensitive matching
+        header_value = headers.get(self.header_name)
+        
+        logger.debug("Header %r value: %r", self.header_name, header_value)
+        
+        # For exists/notExists conditions, we only care if the header is present
+        if self.condition == "exists":
+            result = self.header_name in headers
+            logger.debug("Exists check for %r: %s", self.header_name, result)
+        elif self.condition == "notExists":
+            result = self.header_name not in headers
+        # For other conditions, we need both the header and a usable matcher
+        elif header_value is None or self.match is None:
+            result = False
+        else:
+            result = bool(self.match(header_value))
+        
+        # Apply negation if needed
+        final_result = not result if self.negate else result
+        logger.debug("Rule result before negation: %s, after negation: %s", result, final_result)
+        
+        return final_result
+
+# Patterns that refer to their own groups by number or name can't be fused safely
+_UNFUSABLE_REGEX = re.compile(r"\\[1-9]|\(\?P=|\(\?\(")
+
+class CompiledRuleGroup:
+    """Several "matches" rules on the same header, checked with one fused regex.
+
+    Each pattern sits in its own optional lookahead, so a single match at the
+    start of the value records every pattern that occurs anywhere in it.
+    """
+
+    def __init__(self, rules: list):
+        self.rules = rules
+        self.rule = [r.rule for r in rules]
+        self.header_name = rules[0].header_name
+        self.pattern = re.compile("".join(
+            f"(?:(?=[\\s\\S]*?(?P<r{i}>{r.regex.pattern})))?" for i, r in enumerate(rules)
+        )).match
+        self.negations = [(f"r{i}", r.negate) for i, r in enumerate(rules)]
+
+    def matches(self, headers: Mapping[str, str]) -> bool:
+        """Check that every rule in the group matches (AND logic)."""
+        header_value = headers.get(self.header_name)
+        if header_value is None:
+            # A missing header fails every pattern, so only negated rules pass
+            return all(negate for _, negate in self.negations)
+        found = self.pattern(header_value)
+        for name, negate in self.negations:
+            if (found.group(name) is not None) == negate:
+                logger.debug("Fused rule %s not matched for %r", name, self.header_name)
+                return False
+        return True
+
+def _is_fusable(rule: CompiledRule) -> bool:
+    if rule.regex is None:
+        return False
+    return not rule.regex.groupindex and not _UNFUSABLE_REGEX.search(rule.regex.pattern)
+
+def _fuse_regex_rules(rules: list) -> list:
+    """Replace regex rules that share a header with a single CompiledRuleGroup."""
+    by_header = {}
+    for rule in rules:
+        if _is_fusable(rule):
+            by_header.setdefault(rule.header_name, []).append(rule)
     
-    # For exists/notExists conditions, we only care if the header is present
-    if condition == "exists":
-        result = header_name in lowercase_headers
-        logger.info(f"Exists check for '{header_name}': {result}")
-    elif condition == "notExists":
-        result = header_name not in lowercase_headers
-    # For other conditions, we need both the header and the value
-    elif header_name not in lowercase_headers:
-        result = False
-    elif condition == "equals":
-        result = lowercase_headers[header_name] == value
-    elif condition == "contains":
-        result = value in lowercase_headers[header_name]
-    elif condition == "startsWith":
-        result = lowercase_headers[header_name].startswith(value)
-    elif condition == "endsWith":
-        result = lowercase_headers[header_name].endswith(value)
-    elif condition == "matches":
+    fused = {}
+    for header_name, group in by_header.items():
+        if len(group) < 2:
+            continue
         try:
-            result = bool(re.search(value, lowercase_headers[header_name]))
+            fused[header_name] = CompiledRuleGroup(group)
         except re.error:
-            logger.warning(f"Invalid regex pattern: {value}")
-            result = False
-    else:
-        logger.warning(f"Unknown condition: {condition}")
-        result = False
+            # e.g. inline global flags, which are only allowed at the very start
+            logger.debug("Could not fuse regex rules for %r", header_name)
     
-    # Apply negation if needed
-    final_result = not result if negate else result
-    logger.info(f"Rule result before negation: {result}, after negation: {final_result}")
+    if not fused:
+        return rules
     
-    return final_result
+    # Keep rule order, putting each group where its first member was
+    result = []
+    for rule in rules:
+        group = fused.get(rule.header_name)
+        if group is None or rule not in group.rules:
+            result.append(rule)
+        elif rule is group.rules[0]:
+            result.append(group)
+    return result
 
-def check_header_targeting(campaign: dict, headers: dict) -> bool:
-    """Check if the request headers match the campaign targeting rules."""
-    # If no header rules, campaign applies to all
+def compile_header_rules(campaign: dict) -> list:
+    """Compile a campaign's header targeting rules."""
     header_rules = campaign.get("header_target_rules", [])
     
     # Also check for headerTargetRules (camelCase) for flexibility
     if not header_rules:
         header_rules = campaign.get("headerTargetRules", [])
     
-    if not header_rules:
-        logger.debug("No header targeting rules found, allowing all traffic")
+    return _fuse_regex_rules([CompiledRule(rule) for rule in header_rules or []])
+
+def check_header_targeting(campaign: dict, headers: Mapping[str, str]) -> bool:
+    """Check if the request headers match the campaign targeting rules."""
+    # Campaigns from load_campaign_data are already prepared
+    if campaign and "_rules" not in campaign:
+        prepare_campaign(campaign)
+    
+    # If no header rules, campaign applies to all
+    rules = campaign.get("_rules") if campaign else None
+    if not rules:
         return True
     
-    logger.debug(f"Checking {len(header_rules)} header targeting rules")
+    logger.debug("Checking %d header targeting rules", len(rules))
     
     # Check each rule - all rules must match (AND logic)
-    for rule in header_rules:
-        if not check_header_rule(rule, headers):
-            logger.info(f"Header rule not matched: {rule}")
+    for rule in rules:
+        if not rule.matches(headers):
+            logger.debug("Header rule not matched: %s", rule.rule)
             return False
     
-    logger.info("All header targeting rules matched")
+    logger.debug("All header targeting rules matched")
     return True
 
 @click.command()
@@ -216,109 +545,108 @@ def main(port: int, data_dir: str, log_level: str, json_response: bool) -> int:
 
     app = Server("ai-pricing-mcp-server")
     
+    # What each session has asked to be notified about; entries go away with the session
+    session_log_levels = weakref.WeakKeyDictionary()
+    session_subscriptions = weakref.WeakKeyDictionary()
+    
+    @app.set_logging_level()
+    async def set_logging_level(level: types.LoggingLevel) -> None:
+        session_log_levels[app.request_context.session] = level
+    
+    @app.subscribe_resource()
+    async def subscribe_resource(uri: AnyUrl) -> None:
+        session_subscriptions.setdefault(app.request_context.session, set()).add(str(uri))
+    
+    @app.unsubscribe_resource()
+    async def unsubscribe_resource(uri: AnyUrl) -> None:
+        session_subscriptions.get(app.request_context.session, set()).discard(str(uri))
+    
+    async def notify(ctx, message: str, resource_uri: str = None):
+        """Send pricing notifications, skipping anything the client has not asked for."""
+        session = ctx.session
+        level = session_log_levels.get(session)
+        wants_log = level is not None and LOG_LEVELS.index(level) <= LOG_LEVELS.index("info")
+        subscriptions = session_subscriptions.get(session)
+        wants_resource = False
+        if resource_uri is not None and subscriptions:
+            # Compare in the same normalised form the subscription was stored in
+            resource_uri = str(AnyUrl(resource_uri))
+            wants_resource = resource_uri in subscriptions
+        try:
+            if wants_log:
+                # Sent before the tool result so it rides on the same POST stream
+                await session.send_log_message(
+                    level="info",
+                    data=message,
+                    logger="pricing_service",
+                    related_request_id=ctx.request_id,
+                )
+            if wants_resource:
+                await session.send_resource_updated(uri=AnyUrl(resource_uri))
+        except Exception as e:
+            # A failed notification must not fail the tool call
+            logger.debug("Could not send notification: %s", e)
+    
     @app.call_tool()
     async def call_tool(name: str, arguments: dict) -> list[types.TextContent]:
         ctx = app.request_context
         # Reload campaign data on each request to get the latest
         campaign = load_campaign_data(data_dir)
         
-        # Get request headers from context
-        request_headers = {}
-        
-        # Try different ways to access headers
-        if hasattr(app, 'headers'):
-            # Get headers from app context
-            request_headers = app.headers
-            logger.info(f"Using headers from app context: {request_headers}")
-        elif hasattr(ctx, 'request') and hasattr(ctx.request, 'headers'):
-            # Standard way - convert headers to a dictionary
-            request_headers = dict(ctx.request.headers.items())
-        elif hasattr(ctx, 'request') and hasattr(ctx.request, 'scope') and 'headers' in ctx.request.scope:
-            # ASGI scope way - headers are in the scope
-            request_headers = {k.decode('utf-8').lower(): v.decode('utf-8') 
-                              for k, v in ctx.request.scope['headers']}
-        elif hasattr(ctx, 'request') and hasattr(ctx.request, 'scope') and 'original_headers' in ctx.request.scope:
-            # Get our stored headers
-            request_headers = ctx.request.scope['original_headers']
-        elif hasattr(ctx, 'scope') and 'original_headers' in ctx.scope:
-            # Direct scope access to our stored headers
-            request_headers = ctx.scope['original_headers']
-        
-        # Log all headers for debugging
-        logger.info(f"Request headers extracted: {request_headers}")
+        # Get request headers from the request context
+        request_headers = get_request_headers(ctx)
         
         # Check for authorization header specifically
-        auth_header = next((v for k, v in request_headers.items() 
-                           if k.lower() == 'authorization'), None)
-        logger.info(f"Authorization header found: {auth_header is not None}")
+        auth_header = request_headers.get("authorization")
+        logger.debug("Authorization header found: %s", auth_header is not None)
         
         # Check if campaign is active and targeting matches
         campaign_active = is_campaign_active(campaign)
         targeting_matched = check_header_targeting(campaign, request_headers)
         
         # Log the targeting results
-        logger.info(f"Campaign active: {campaign_active}, Targeting matched: {targeting_matched}")
+        logger.debug("Campaign active: %s, Targeting matched: %s", campaign_active, targeting_matched)
         
         # If campaign is not active or targeting doesn't match, return standard message
         if not campaign_active or not targeting_matched:
-            no_pricing_msg = "We don't have any special pricing available for you at this time."
-            
             # Send notification about the rejection
-            async def send_notification():
-                reason = "inactive campaign" if not campaign_active else "targeting mismatch"
-                await ctx.session.send_log_message(
-                    level="info",
-                    data=f"Pricing request denied: {reason}",
-                    logger="pricing_service",
-                    related_request_id=ctx.request_id,
-                )
+            reason = "inactive campaign" if not campaign_active else "targeting mismatch"
+            await notify(ctx, f"Pricing request denied: {reason}")
                 
-            if task_group:
-                task_group.start_soon(send_notification)
-                
-            return [types.TextContent(type="text", text=json.dumps({"message": no_pricing_msg}))]
+            return list(_NO_PRICING_RESPONSE)
         
         # Process the tool call if campaign is active and targeting matches
         if name == "get-products":
-            return handle_get_products(campaign, ctx)
+            return await handle_get_products(campaign, ctx)
         elif name == "get-discount":
             product_id = arguments.get("product_id")
-            return handle_get_discount(campaign, product_id, ctx)
+            return await handle_get_discount(campaign, product_id, ctx)
         else:
             return [types.TextContent(type="text", text=f"Unknown tool: {name}")]
     
-    def handle_get_products(campaign: dict, ctx) -> list[types.TextContent]:
-        products = campaign.get("detailed_products", [])
+    async def handle_get_products(campaign: dict, ctx) -> list[types.TextContent]:
+        products = campaign.get("detailed_products") or []
         
-        # Send notification about products retrieval
-        async def send_notification():
-            await ctx.session.send_log_message(
-                level="info",
-                data=f"Retrieved {len(products)} products from active campaign",
-                logger="pricing_service",
-                related_request_id=ctx.request_id,
-            )
-            # Notify about resource update
-            await ctx.session.send_resource_updated(uri=AnyUrl("http:///products"))
-            
-        if task_group:
-            task_group.start_soon(send_notification)
+        # Send notification about products retrieval and the resource update
+        await notify(ctx, f"Retrieved {len(products)} products from active campaign", "http:///products")
             
-        return [types.TextContent(type="text", text=json.dumps({"products": products}))]
-    
-    def handle_get_discount(campaign: dict, product_id: str, ctx) -> list[types.TextContent]:
-        products = campaign.get("detailed_products", [])
-        discounts = campaign.get("detailed_discounts", [])
+        # Serialize once per campaign file change and reuse the string after that
+        products_json = campaign.get("_products_json")
+        if products_json is None:
+            products_json = campaign["_products_json"] = json_dumps({"products": products})
         
+        return [types.TextContent(type="text", text=products_json)]
+    
+    async def handle_get_discount(campaign: dict, product_id: str, ctx) -> list[types.TextContent]:
         # Find the product
-        product = next((p for p in products if str(p.get("id")) == str(product_id)), None)
+        product = campaign["_products_by_id"].get(str(product_id))
         if not product:
-            return [types.TextContent(type="text", text=json.dumps({"error": "Product not found"}))]
+            return list(_PRODUCT_NOT_FOUND_RESPONSE)
         
         # Get the first discount code
-        discount = discounts[0] if discounts else None
+        discount = campaign["_discount"]
         if not discount:
-            return [types.TextContent(type="text", text=json.dumps({"error": "No discount available"}))]
+            return list(_NO_DISCOUNT_RESPONSE)
         
         result = {
             "product": product,
@@ -326,21 +654,10 @@ def main(port: int, data_dir: str, log_level: str, json_response: bool) -> int:
             "discount_percentage": product.get("discount_percentage")
         }
         
-        # Send notification about discount retrieval
-        async def send_notification():
-            await ctx.session.send_log_message(
-                level="info",
-                data=f"Retrieved discount for product {product_id}: {discount.get('code')}",
-                logger="pricing_service",
-                related_request_id=ctx.request_id,
-            )
-            # Notify about resource update
-            await ctx.session.send_resource_updated(uri=AnyUrl(f"http:///discount/{product_id}"))
-            
-        if task_group:
-            task_group.start_soon(send_notification)
+        # Send notification about discount retrieval and the resource update
+        await notify(ctx, f"Retrieved discount for product {product_id}: {discount.get('code')}", f"http:///discount/{product_id}")
         
-        return [types.TextContent(type="text", text=json.dumps(result))]
+        return [types.TextContent(type="text", text=json_dumps(result))]
     
     @app.list_tools()
     async def list_tools() -> list[types.Tool]:
@@ -366,41 +683,46 @@ def main(port: int, data_dir: str, log_level: str, json_response: bool) -> int:
             )
         ]
     
-    # We need to store the server instances between requests
-    server_instances = {}
     # Lock to prevent race conditions when creating new sessions
     session_creation_lock = anyio.Lock()
+    # Build once, after all handlers are registered, and share across sessions
+    init_options = app.create_initialization_options()
 
     # ASGI handler for streamable HTTP connections
     async def handle_streamable_http(scope, receive, send):
         request = Request(scope, receive)
         request_mcp_session_id = request.headers.get(MCP_SESSION_ID_HEADER)
+        # Headers look up case-insensitively, so tools use them without copying
+        request_headers_var.set(request.headers)
         
         # Log all headers for debugging - both as dict and raw from scope
-        logger.info(f"Incoming request headers (dict): {dict(request.headers)}")
-        if 'headers' in scope:
-            raw_headers = [(k.decode('utf-8'), v.decode('utf-8')) for k, v in scope['headers']]
-            logger.info(f"Incoming request raw headers from scope: {raw_headers}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Incoming request headers (dict): %s", dict(request.headers))
+            if 'headers' in scope:
+                raw_headers = [(k.decode('utf-8'), v.decode('utf-8')) for k, v in scope['headers']]
+                logger.debug("Incoming request raw headers from scope: %s", raw_headers)
         
-        if (
-            request_mcp_session_id is not None
-            and request_mcp_session_id in server_instances
-        ):
-            transport = server_instances[request_mcp_session_id]
+        transport = (
+            session_registry.get(request_mcp_session_id)
+            if request_mcp_session_id is not None
+            else None
+        )
+        if transport is not None:
             logger.debug("Session already exists, handling request directly")
-            await transport.handle_request(scope, receive, send)
+            with session_registry.in_use(request_mcp_session_id):
+                await transport.handle_request(scope, receive, send)
         elif request_mcp_session_id is None:
             # try to establish new session
             logger.debug("Creating new transport")
             # Use lock to prevent race conditions when creating new sessions
             async with session_creation_lock:
-                new_session_id = uuid4().hex
+                new_session_id = secrets.token_hex(16)
                 http_transport = StreamableHTTPServerTransport(
                     mcp_session_id=new_session_id,
                     is_json_response_enabled=json_response,
                     event_store=event_store,  # Enable resumability
                 )
-                server_instances[http_transport.mcp_session_id] = http_transport
+                evicted = session_registry.add(http_transport.mcp_session_id, http_transport)
                 logger.info(f"Created new transport with session ID: {new_session_id}")
 
                 async def run_server(task_status=None):
@@ -409,39 +731,36 @@ def main(port: int, data_dir: str, log_level: str, json_response: bool) -> int:
                         if task_status:
                             task_status.started()
                         
-                        # Store headers in app context
-                        app.headers = dict(request.headers)
-                        logger.info(f"Stored headers in app context: {app.headers}")
-                        
                         await app.run(
                             read_stream,
                             write_stream,
-                            app.create_initialization_options(),
+                            init_options,
                         )
 
                 if not task_group:
                     raise RuntimeError("Task group is not initialized")
 
+                # The session task inherits request_headers_var from this context
                 await task_group.start(run_server)
 
-                # Store the original headers in the scope for later access
-                if 'headers' in scope:
-                    # Store headers in a format that can be easily accessed later
-                    scope['original_headers'] = dict(request.headers)
-                    logger.info(f"Stored original headers in scope: {scope['original_headers']}")
+                # Close any sessions pushed out by the session cap
+                for old_transport in evicted:
+                    task_group.start_soon(close_transport, old_transport)
 
                 # Handle the HTTP request and return the response
-                await http_transport.handle_request(scope, receive, send)
+                with session_registry.in_use(new_session_id):
+                    await http_transport.handle_request(scope, receive, send)
         else:
+            # The session was terminated or expired; 404 tells the client to start a new one
             response = Response(
-                "Bad Request: No valid session ID provided",
-                status_code=HTTPStatus.BAD_REQUEST,
+                "Not Found: Session has been terminated or does not exist",
+                status_code=HTTPStatus.NOT_FOUND,
             )
             await response(scope, receive, send)
 
     # Create an ASGI application using the transport
     starlette_app = Starlette(
-        debug=True,
+        debug=os.getenv("DEBUG", "0") == "1",
         routes=[
             Mount("/mcp", app=handle_streamable_http),
         ],
@@ -451,7 +770,14 @@ def main(port: int, data_dir: str, log_level: str, json_response: bool) -> int:
     # Start the server
     logger.info(f"Starting MCP server on port {port}")
     import uvicorn
-    uvicorn.run(starlette_app, host="0.0.0.0", port=port)
+    # uvicorn[standard] lets the default "auto" loop and http pick uvloop and httptools
+    uvicorn.run(
+        starlette_app,
+        host="0.0.0.0",
+        port=port,
+        lifespan="on",
+        log_level=log_level.lower(),
+    )
     
     return 0
 